@@ -0,0 +1,128 @@
+import importlib
+import os
+import re
+import string
+import textwrap
+
+import pytest
+
+tinyhost_module = importlib.import_module("tinyhost.tinyhost")
+
+ID_RE = re.compile(r'const datastoreId = "(\w+)";')
+POST_DICT = {"url": "https://post", "fields": {"key": "datastore.json"}}
+
+
+@pytest.fixture(autouse=True)
+def presigned_urls(monkeypatch):
+    # No S3 calls, the presigned URLs just name the datastore they were made for
+    calls = []
+
+    def get_datastore_presigned_urls(bucket, prefix, datastore_id, duration, existing_keys=None):
+        calls.append(datastore_id)
+        return f"https://get/{datastore_id}", POST_DICT
+
+    monkeypatch.setattr(tinyhost_module, "get_datastore_presigned_urls", get_datastore_presigned_urls)
+    return calls
+
+
+def update(html, reset=False):
+    return tinyhost_module.update_datastore_section(html, "bucket", "", 604800, reset)
+
+
+def datastore_script(html, opening_tag="<script>"):
+    datastore_id = ID_RE.search(html)[1]
+    section = tinyhost_module.get_datastore_section(datastore_id, f"https://get/{datastore_id}", POST_DICT)
+    return opening_tag + section + "</script>"
+
+
+def test_head_without_end_tag():
+    html = "<html><head><title>T</title><body>b</body></html>"
+    updated = update(html)
+    assert updated == "<html><head><title>T</title>" + datastore_script(updated) + "\n<body>b</body></html>"
+    assert update(updated) == updated
+
+    updated = update("<head><title>T</title>")
+    assert updated == "<head><title>T</title>" + datastore_script(updated) + "\n"
+
+
+def test_missing_head():
+    with pytest.raises(ValueError, match="Could not find <head>"):
+        update("<html><body>b</body></html>")
+
+
+def test_refresh_keeps_datastore_and_the_rest_of_the_page(presigned_urls):
+    html = update('<html><head><script src="a.js"></script><title>T</title></head><body>b</body></html>')
+    datastore_id = ID_RE.search(html)[1]
+
+    refreshed = update(html)
+
+    assert refreshed == html
+    assert presigned_urls == [datastore_id, datastore_id]
+
+
+def test_refresh_keeps_script_attributes():
+    html = update("<html><head></head><body></body></html>").replace("<script>", '<script type="text/javascript">')
+
+    refreshed = update(html)
+
+    script = datastore_script(html, '<script type="text/javascript">')
+    assert refreshed == "<html><head>" + script + "\n</head><body></body></html>"
+
+
+def test_reset_creates_a_new_datastore():
+    html = update("<html><head></head><body></body></html>")
+
+    reset = update(html, reset=True)
+
+    assert ID_RE.search(reset)[1] != ID_RE.search(html)[1]
+    assert reset.count("<script>") == 1
+
+
+def test_refresh_with_uppercase_tags():
+    html = update("<HTML><HEAD><TITLE>T</TITLE></HEAD><BODY>b</BODY></HTML>")
+    uppercase = html.replace("<script>", "<SCRIPT>").replace("</script>", "</SCRIPT>")
+
+    assert update(uppercase) == uppercase.replace("</SCRIPT>", "</script>")
+
+
+def test_marker_script_not_in_the_expected_format():
+    # The marker isn't at the start of the script, and the head has content that an HTML parser would move
+    head_end = "<div>oops</div><title>T</title></head><body>b</body></html>"
+    html = (
+        "<html><head><script>var a = 1;</script><script>/* x */\n"
+        "// BEGIN TINYHOST DATASTORE SECTION\n"
+        'const datastoreId = "abc123";</script>' + head_end
+    )
+
+    updated = update(html)
+
+    assert updated == "<html><head><script>var a = 1;</script>" + datastore_script(updated) + head_end
+    assert ID_RE.search(updated)[1] == "abc123"
+
+
+def test_first_insert_goes_before_head_end():
+    html = "<html><head><title>T</title></head><body>b</body></html>"
+    updated = update(html)
+
+    assert updated == "<html><head><title>T</title>" + datastore_script(updated) + "\n</head><body>b</body></html>"
+
+
+def test_first_insert_with_uppercase_tags():
+    html = "<HTML><HEAD><TITLE>T</TITLE></HEAD><BODY>b</BODY></HTML>"
+    updated = update(html)
+
+    assert updated == "<HTML><HEAD><TITLE>T</TITLE>" + datastore_script(updated) + "\n</HEAD><BODY>b</BODY></HTML>"
+
+
+def test_get_datastore_section_fills_the_template():
+    with open(os.path.join(os.path.dirname(tinyhost_module.__file__), "datastore_template.js")) as f:
+        template = string.Template(f.read())
+
+    expected = template.substitute(
+        datastore_id="abc123",
+        presigned_get_url="https://get",
+        presigned_post_dict='{"url":"https://post","fields":{"key":"datastore.json"}}',
+    )
+    expected = "\n" + textwrap.indent(expected, "    ", lambda line: True).rstrip() + "\n"
+
+    assert tinyhost_module.get_datastore_section("abc123", "https://get", POST_DICT) == expected
@@ -0,0 +1,123 @@
+import calendar
+import datetime
+import time
+
+import boto3
+import botocore.auth
+import pytest
+from botocore.awsrequest import AWSRequest
+from botocore.config import Config
+from botocore.credentials import Credentials, RefreshableCredentials
+
+from tinyhost.tinyhost import s3_client, stable_signing_time
+
+WEEK = 7 * 24 * 3600
+
+
+class FrozenDatetime(datetime.datetime):
+    # 26 minutes past the hour by default, so truncation to the hour is visible
+    frozen = (2026, 1, 1, 5, 26, 13)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls(*cls.frozen, tzinfo=tz)
+
+
+def freeze_clock(monkeypatch, minute, second=0):
+    frozen = (2026, 1, 1, 5, minute, second)
+    monkeypatch.setattr(FrozenDatetime, "frozen", frozen)
+    monkeypatch.setattr(datetime, "datetime", FrozenDatetime)
+    monkeypatch.setattr(time, "time", lambda: float(calendar.timegm(frozen)))
+
+
+def presign(client, duration):
+    with stable_signing_time(duration):
+        get_url = client.generate_presigned_url(
+            "get_object", Params={"Bucket": "bucket", "Key": "key"}, ExpiresIn=duration
+        )
+        post_dict = client.generate_presigned_post(Bucket="bucket", Key="key", ExpiresIn=duration)
+    return get_url, post_dict
+
+
+@pytest.fixture(params=["s3v4", "s3"])
+def client(request):
+    # SigV4 and SigV2 (the default for presigned URLs in us-east-1 on older botocore versions) read the clock differently
+    return boto3.client(
+        "s3",
+        region_name="us-east-1",
+        aws_access_key_id="AKIDEXAMPLE",
+        aws_secret_access_key="secret",
+        config=Config(signature_version=request.param),
+    )
+
+
+def test_presigns_are_stable_within_the_hour(monkeypatch, client):
+    freeze_clock(monkeypatch, 26)
+    first = presign(client, WEEK)
+    freeze_clock(monkeypatch, 48, 59)
+    second = presign(client, WEEK)
+
+    assert first == second
+
+
+def test_short_durations_use_the_real_time(monkeypatch, client):
+    freeze_clock(monkeypatch, 26)
+    first = presign(client, 3600)
+    freeze_clock(monkeypatch, 48, 59)
+    second = presign(client, 3600)
+
+    assert first[0] != second[0]
+    assert first[1] != second[1]
+
+
+def test_presigns_outside_the_block_use_the_real_time(monkeypatch, client):
+    freeze_clock(monkeypatch, 26)
+    first = client.generate_presigned_url("get_object", Params={"Bucket": "bucket", "Key": "key"}, ExpiresIn=WEEK)
+    freeze_clock(monkeypatch, 48, 59)
+    second = client.generate_presigned_url("get_object", Params={"Bucket": "bucket", "Key": "key"}, ExpiresIn=WEEK)
+
+    assert first != second
+
+
+def test_regular_requests_keep_the_real_time(monkeypatch):
+    monkeypatch.setattr(datetime, "datetime", FrozenDatetime)
+    credentials = Credentials("AKIDEXAMPLE", "secret")
+
+    with stable_signing_time(WEEK):
+        request = AWSRequest(method="POST", url="https://sts.amazonaws.com/", data=b"")
+        botocore.auth.SigV4Auth(credentials, "sts", "us-east-1").add_auth(request)
+        presign_request = AWSRequest(method="GET", url="https://bucket.s3.amazonaws.com/key")
+        botocore.auth.S3SigV4QueryAuth(credentials, "s3", "us-east-1", expires=WEEK).add_auth(presign_request)
+
+    assert request.context["timestamp"] == "20260101T052613Z"
+    assert presign_request.context["timestamp"] == "20260101T050000Z"
+
+
+def test_credential_refresh_during_presign_keeps_the_real_time(monkeypatch):
+    monkeypatch.setattr(datetime, "datetime", FrozenDatetime)
+    refresh_timestamps = []
+
+    def refresh():
+        # Stands in for the STS AssumeRole call that botocore makes when assumed role credentials expire
+        request = AWSRequest(method="POST", url="https://sts.amazonaws.com/", data=b"")
+        botocore.auth.SigV4Auth(Credentials("AKIDEXAMPLE", "secret"), "sts", "us-east-1").add_auth(request)
+        refresh_timestamps.append(request.context["timestamp"])
+        return {
+            "access_key": "AKIDREFRESHED",
+            "secret_key": "secret",
+            "token": None,
+            "expiry_time": "2100-01-01T00:00:00Z",
+        }
+
+    credentials = RefreshableCredentials.create_from_metadata(
+        {"access_key": "AKIDEXPIRED", "secret_key": "secret", "token": None, "expiry_time": "2000-01-01T00:00:00Z"},
+        refresh_using=refresh,
+        method="assume-role",
+    )
+    monkeypatch.setattr(s3_client._request_signer, "_credentials", credentials)
+
+    with stable_signing_time(WEEK):
+        url = s3_client.generate_presigned_url("get_object", Params={"Bucket": "bucket", "Key": "key"}, ExpiresIn=WEEK)
+
+    assert refresh_timestamps == ["20260101T052613Z"]
+    assert "AKIDREFRESHED" in url
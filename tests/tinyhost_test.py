@@ -0,0 +1,228 @@
+import hashlib
+import importlib
+import io
+import json
+import os
+import re
+import tempfile
+
+import pytest
+from botocore.credentials import Credentials
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+from click.testing import CliRunner
+
+tinyhost_module = importlib.import_module("tinyhost.tinyhost")
+
+PAGE = "<html><head><title>T</title></head><body>b</body></html>"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    # Presigning happens locally but needs credentials, every actual S3 call has to be stubbed
+    monkeypatch.setattr(tinyhost_module.s3_client._request_signer, "_credentials", Credentials("AKIDEXAMPLE", "secret"))
+    with Stubber(tinyhost_module.s3_client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def add_missing(s3, count=1):
+    for _ in range(count):
+        s3.add_client_error("head_object", service_error_code="404", http_status_code=404)
+
+
+def add_new_page(s3):
+    # HEAD and create the datastore, then HEAD and upload the page
+    add_missing(s3)
+    s3.add_response("put_object", {})
+    add_missing(s3)
+    s3.add_response("put_object", {})
+
+
+def test_same_file_given_twice_is_processed_once(s3, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.html").write_text(PAGE)
+    add_new_page(s3)
+
+    urls = tinyhost_module.tinyhost_main(["a.html", "./a.html", str(tmp_path / "a.html")], bucket="bucket")
+
+    assert len(set(urls)) == 1
+    assert (tmp_path / "a.html").read_text().count("BEGIN TINYHOST DATASTORE SECTION") == 1
+
+
+@pytest.mark.parametrize("bad_file", ["missing.html", "page.txt"])
+def test_bad_file_stops_before_anything_is_uploaded(s3, tmp_path, monkeypatch, bad_file):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.html").write_text(PAGE)
+    (tmp_path / "page.txt").write_text(PAGE)
+
+    # No S3 responses are stubbed, so any upload would fail the test
+    with pytest.raises(RuntimeError, match=bad_file):
+        tinyhost_module.tinyhost_main(["a.html", bad_file], bucket="bucket")
+
+    assert (tmp_path / "a.html").read_text() == PAGE
+
+
+def test_list_existing_keys_stops_at_a_truncated_page(s3):
+    s3.add_response(
+        "list_objects_v2",
+        {"Contents": [{"Key": "a.json"}], "IsTruncated": True, "NextContinuationToken": "next"},
+        {"Bucket": "bucket", "Prefix": ""},
+    )
+
+    assert tinyhost_module.list_existing_keys("bucket", "") is None
+
+
+def test_list_existing_keys_under_prefix(s3):
+    s3.add_response(
+        "list_objects_v2",
+        {"Contents": [{"Key": "pages/a.json"}, {"Key": "pages/b.html"}], "IsTruncated": False},
+        {"Bucket": "bucket", "Prefix": "pages/"},
+    )
+
+    assert tinyhost_module.list_existing_keys("bucket", "pages") == {"pages/a.json", "pages/b.html"}
+
+
+def test_list_existing_keys_not_allowed(s3):
+    s3.add_client_error("list_objects_v2", service_error_code="AccessDenied", http_status_code=403)
+
+    assert tinyhost_module.list_existing_keys("bucket", "") is None
+
+
+def test_several_files_use_one_listing_instead_of_heads(s3, tmp_path):
+    paths = [tmp_path / "a.html", tmp_path / "b.html"]
+    for path in paths:
+        path.write_text(PAGE)
+    s3.add_response("list_objects_v2", {"IsTruncated": False})
+    for _ in range(4):
+        s3.add_response("put_object", {})
+
+    urls = tinyhost_module.tinyhost_main([str(path) for path in paths], bucket="bucket")
+
+    assert len(set(urls)) == 2
+
+
+def test_upload_is_skipped_when_the_page_exists(s3):
+    key = "pages/a-" + hashlib.sha1(b"page").hexdigest()[:12] + ".html"
+    s3.add_response("head_object", {}, {"Bucket": "bucket", "Key": key})
+
+    url = tinyhost_module.upload_html_file(b"page", "bucket", "pages", "a", ".html", 604800)
+
+    assert f"/{key}?" in url
+
+
+def test_upload_when_the_page_is_new(s3):
+    key = "a-" + hashlib.sha1(b"page").hexdigest()[:12] + ".html"
+    s3.add_client_error(
+        "head_object", service_error_code="404", http_status_code=404, expected_params={"Bucket": "bucket", "Key": key}
+    )
+    s3.add_response("put_object", {})
+
+    url = tinyhost_module.upload_html_file(b"page", "bucket", "", "a", ".html", 604800)
+
+    assert f"/{key}?" in url
+
+
+@pytest.fixture
+def bucket_cache(tmp_path, monkeypatch):
+    cache_path = tmp_path / "tinyhost"
+    monkeypatch.setattr(tinyhost_module, "_BUCKET_CACHE_PATH", str(cache_path))
+    monkeypatch.delenv("TINYHOST_BUCKET", raising=False)
+    monkeypatch.setattr(tinyhost_module, "get_caller_username", lambda: "alice")
+    tinyhost_module.run_new_bucket_flow.cache_clear()
+    yield cache_path
+    tinyhost_module.run_new_bucket_flow.cache_clear()
+
+
+def test_bucket_from_the_environment(s3, bucket_cache, monkeypatch):
+    monkeypatch.setenv("TINYHOST_BUCKET", "env-bucket")
+
+    assert tinyhost_module.run_new_bucket_flow() == "env-bucket"
+
+
+def test_detected_bucket_is_cached(s3, bucket_cache):
+    s3.add_client_error("head_bucket", service_error_code="404", http_status_code=404)
+    s3.add_response("create_bucket", {}, {"Bucket": "alice-tinyhost"})
+
+    assert tinyhost_module.run_new_bucket_flow() == "alice-tinyhost"
+    assert json.loads(bucket_cache.read_text()) == {tinyhost_module._session.profile_name: "alice-tinyhost"}
+
+
+def test_cached_bucket_skips_the_lookup(s3, bucket_cache, monkeypatch):
+    bucket_cache.write_text(json.dumps({tinyhost_module._session.profile_name: "cached-bucket"}))
+    monkeypatch.setattr(tinyhost_module, "get_caller_username", lambda: pytest.fail("STS should not be called"))
+    s3.add_response("head_bucket", {}, {"Bucket": "cached-bucket"})
+
+    assert tinyhost_module.run_new_bucket_flow() == "cached-bucket"
+
+
+def test_stale_cached_bucket_is_replaced(s3, bucket_cache):
+    bucket_cache.write_text(json.dumps({tinyhost_module._session.profile_name: "deleted-bucket"}))
+    s3.add_client_error("head_bucket", service_error_code="404", http_status_code=404)
+    s3.add_response("head_bucket", {}, {"Bucket": "alice-tinyhost"})
+
+    assert tinyhost_module.run_new_bucket_flow() == "alice-tinyhost"
+    assert json.loads(bucket_cache.read_text()) == {tinyhost_module._session.profile_name: "alice-tinyhost"}
+
+
+@pytest.fixture
+def fixed_datastore(monkeypatch):
+    # Same presigned URLs on every run, so that a refreshed page comes out byte for byte the same
+    monkeypatch.setattr(
+        tinyhost_module,
+        "get_datastore_presigned_urls",
+        lambda bucket, prefix, datastore_id, duration, existing_keys=None: ("https://get", {"url": "https://post"}),
+    )
+
+
+def test_no_in_place_leaves_the_file_untouched(s3, fixed_datastore, tmp_path):
+    (tmp_path / "a.html").write_text(PAGE)
+    add_missing(s3)
+    s3.add_response("put_object", {})
+
+    result = CliRunner().invoke(
+        tinyhost_module.tinyhost, ["--bucket", "bucket", "--no-in-place", str(tmp_path / "a.html")]
+    )
+
+    assert "Access it at:" in result.output
+    assert (tmp_path / "a.html").read_text() == PAGE
+
+
+def test_unchanged_page_is_not_rewritten(s3, fixed_datastore, tmp_path):
+    path = tmp_path / "a.html"
+    path.write_text(PAGE)
+    add_missing(s3)
+    s3.add_response("put_object", {})
+    first_url = tinyhost_module.tinyhost_main([str(path)], bucket="bucket")
+    assert "BEGIN TINYHOST DATASTORE SECTION" in path.read_text()
+
+    os.utime(path, ns=(0, 0))
+    s3.add_response("head_object", {})
+    second_url = tinyhost_module.tinyhost_main([str(path)], bucket="bucket")
+
+    assert second_url == first_url
+    assert path.stat().st_mtime_ns == 0
+
+
+def test_link_is_downloaded_into_memory_and_rehosted(s3, fixed_datastore, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(tempfile, "NamedTemporaryFile", lambda *args, **kwargs: pytest.fail("No temp file needed"))
+    page = PAGE.encode("utf-8")
+    old_key = "pages/a-0123456789ab.html"
+    s3.add_response(
+        "head_object", {"ContentLength": len(page), "ETag": '"etag"'}, {"Bucket": "linked-bucket", "Key": old_key}
+    )
+    s3.add_response(
+        "get_object",
+        {"Body": StreamingBody(io.BytesIO(page), len(page)), "ContentLength": len(page), "ETag": '"etag"'},
+    )
+    add_missing(s3)
+    s3.add_response("put_object", {})
+
+    urls = tinyhost_module.tinyhost_main(
+        [f"https://linked-bucket.s3.amazonaws.com/{old_key}?X-Amz-Signature=abc"], bucket="bucket", prefix="pages"
+    )
+
+    assert re.match(r"https://linked-bucket\.s3\.amazonaws\.com/pages/a-[0-9a-f]{12}\.html\?", urls[0])
+    assert old_key not in urls[0]
+    assert list(tmp_path.iterdir()) == []
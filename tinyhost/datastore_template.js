@@ -6,9 +6,9 @@
 // Please don't change anything here by hand
 // If it's not working, try running tinyhost again and getting a fresh link
 
-const datastoreId = "{{ datastore_id }}";
-const presignedGetUrl = "{{ presigned_get_url }}";
-const presignedPostDict = {{ presigned_post_dict }};
+const datastoreId = "$datastore_id";
+const presignedGetUrl = "$presigned_get_url";
+const presignedPostDict = $presigned_post_dict;
 
 
 // Fetch state from the S3-backed datastore
@@ -1,24 +1,92 @@
+import contextlib
+import functools
 import hashlib
+import io
 import json
+import mmap
 import os
 import re
 import secrets
-import string
-import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from urllib.parse import urlparse
 
 import boto3
+import botocore.auth
+import botocore.signers
 import click
 import magic
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError
-from bs4 import BeautifulSoup
 
-s3_client = boto3.client("s3")
+try:
+    import orjson
+
+    def dump_json(obj):
+        return orjson.dumps(obj).decode("utf-8")
+
+except ImportError:
+
+    def dump_json(obj):
+        # Same compact, non-escaped output as orjson, so pages (and their hashes) come out identical either way
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+# One session for all clients, so endpoint and credential resolution only happen once. The connection pool
+# is sized for the per-file thread pool plus concurrent multipart chunks, with connections kept alive between calls
+_session = boto3.session.Session()
+s3_client = _session.client(
+    "s3",
+    config=Config(max_pool_connections=64, retries={"mode": "adaptive", "max_attempts": 5}, tcp_keepalive=True),
+)
+
+# Remembers the automatically detected bucket of each AWS profile between runs
+_BUCKET_CACHE_PATH = os.path.expanduser("~/.tinyhost")
+
+# Large pages (ex. notebooks with embedded images) get uploaded as concurrent multipart chunks,
+# typical pages stay well under the threshold and go up in a single PUT
+_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=16 * 1024 * 1024, multipart_chunksize=16 * 1024 * 1024, max_concurrency=16, use_threads=True
+)
+
+
+# The datastore template is static, so it's read, indented and split around its $placeholders once at import,
+# odd entries of _DATASTORE_TEMPLATE_PARTS are placeholder names and even ones the literal text between them
+with open(os.path.join(os.path.dirname(__file__), "datastore_template.js"), "r") as _f:
+    _DATASTORE_TEMPLATE_PARTS = re.split(
+        r"\$(datastore_id|presigned_get_url|presigned_post_dict)\b",
+        ("\n" + _f.read()).replace("\n", "\n    ").rstrip() + "\n",
+    )
+
+_HTTP_RE = re.compile(r"^https?://", re.IGNORECASE)
+# The “-<12-char-hash>” (and extension) that tinyhost appends to uploaded file names
+_HASH_SUFFIX_RE = re.compile(r"(-[a-fA-F0-9]{12})?(\.\w+)?$")
+# Matches the raw <head>...</head> span, so that only the head needs to be searched and edited
+_HEAD_RE = re.compile(r"<head\b[^>]*>.*?</head>", re.DOTALL | re.IGNORECASE)
+# The </head> end tag is optional in HTML, without it the head runs up to the <body> (or the end of the page)
+_HEAD_START_RE = re.compile(r"<head\b[^>]*>", re.IGNORECASE)
+_BODY_START_RE = re.compile(r"<body\b", re.IGNORECASE)
+_HEAD_END_RE = re.compile(rb"</head>", re.IGNORECASE)
+_DATASTORE_MARKER = "BEGIN TINYHOST DATASTORE SECTION"
+# Matches a previously inserted datastore <script> (the first one whose contents have the marker anywhere),
+# group 1 is the opening tag and group 2 its contents
+_DATASTORE_RE = re.compile(
+    r"(<script\b[^>]*>)((?:(?!</script>).)*?" + _DATASTORE_MARKER + r".*?)</script>", re.DOTALL | re.IGNORECASE
+)
+_DATASTORE_ID_RE = re.compile(r'const datastoreId = "(\w+)";')
 
 
 def tinyhost_main(
-    html_files: list[str], bucket: Optional[str] = None, prefix: str = "", duration: int = 604800, reset: bool = False
+    html_files: list[str],
+    bucket: Optional[str] = None,
+    prefix: str = "",
+    duration: int = 604800,
+    reset: bool = False,
+    in_place: bool = True,
+    strict_mime: bool = False,
 ):
     """
     Core logic that uploads an HTML file (or .ipynb) to S3 and returns signed URLs.
@@ -29,6 +97,9 @@ def tinyhost_main(
     :param prefix: S3 bucket prefix, defaults to "".
     :param duration: Expiration for the resulting link, default is 1 week (604800 seconds).
     :param reset: If True, resets the “datastore” portion inside <head>.
+    :param in_place: If True, local html files are updated with their datastore section, so that the next run
+        keeps using the same datastore.
+    :param strict_mime: If True, html files are also checked with libmagic to really be text/html.
     :return: List of resulting signed URLs (one per file).
     """
     if isinstance(html_files, str):
@@ -45,220 +116,445 @@ def tinyhost_main(
         if not bucket:
             raise RuntimeError("Unable to automatically detect/create an S3 bucket, please specify one using --bucket")
 
-    results = []
-
+    # Resolve the bucket for each file up front, so that the files can then be processed concurrently,
+    # and check all paths before anything gets uploaded or rewritten. A file given more than once is only
+    # processed once (concurrent workers would race on it), and all its mentions get the same URL
+    jobs: list[tuple[str, str]] = []
+    job_indices = {}
+    file_jobs = []
     for html_file in html_files:
-        temp_file_name = None
+        if _HTTP_RE.match(html_file):
+            # Basic attempt to parse bucket name from the domain of an existing tinyhost link,
+            # it overrides the function's bucket for this file and the ones after it
+            bucket = urlparse(html_file).netloc.split(".")[0]
+
         try:
-            # If the user passed an existing tinyhost link, download it to a temporary file
-            if re.match(r"^https?://", html_file, re.IGNORECASE):
-                parsed = urlparse(html_file)
-                domain_parts = parsed.netloc.split(".")
-                # Basic attempt to parse bucket name from domain
-                bucket_from_url = domain_parts[0]
-                s3_key = parsed.path.lstrip("/")
-
-                # We'll override the function's bucket with the one we just parsed
-                bucket = bucket_from_url
-
-                file_basename = os.path.splitext(os.path.basename(s3_key))[0].lower()
-                # Strip out the final “-<12-char-hash>” if it exists
-                file_basename = re.sub(r"(-[a-fA-F0-9]{12})?(\.\w+)?$", "", file_basename)
-                file_extension = os.path.splitext(s3_key)[-1].lower()
-
-                # Download the file from S3 to a local temp file
-                with tempfile.NamedTemporaryFile("wb", suffix=file_extension, delete=False) as download_tmp:
-                    s3_client.download_fileobj(bucket, s3_key, download_tmp)
-                    downloaded_temp_file = download_tmp.name
-
-                # Now we consider this downloaded file as our target
-                html_file = downloaded_temp_file
-
-            else:
-                # Make sure local path exists
-                if not os.path.exists(html_file):
-                    raise FileNotFoundError(f"Path {html_file} does not exist")
-
-                file_basename = os.path.splitext(os.path.basename(html_file))[0].lower()
-                file_extension = os.path.splitext(html_file)[-1].lower()
-
-            # Process HTML or ipynb
-            if file_extension in [".htm", ".html"]:
-                mime = magic.Magic(mime=True)
-                content_type = mime.from_file(html_file)
-
-                if content_type != "text/html":
-                    raise ValueError("Your file was not detected as text/html.")
-
-                # Insert or update the datastore script
-                with open(html_file, "r") as f:
-                    html_content = f.read()
-
-                soup = BeautifulSoup(html_content, "html.parser")
-                head_tag = soup.find("head")
-                if not head_tag:
-                    raise ValueError("Could not find <head> in your HTML. Please add one.")
-
-                script_tags = head_tag.find_all("script")
-                found_existing_template = False
-                for script_tag in script_tags:
-                    if script_tag.string and "BEGIN TINYHOST DATASTORE SECTION" in script_tag.string:
-                        if reset:
-                            datastore_id = generate_new_datastore()
-                        else:
-                            # Attempt to find existing datastoreId
-                            datastore_re = re.search(r'const datastoreId = "(\w+)";', script_tag.string)
-                            datastore_id = datastore_re[1] if datastore_re else generate_new_datastore()
-
-                        get_url, post_dict = get_datastore_presigned_urls(bucket, prefix, datastore_id, duration)
-                        script_tag.string = get_datastore_section(datastore_id, get_url, post_dict)
-                        found_existing_template = True
-                        break
-
-                if not found_existing_template:
-                    new_script = soup.new_tag("script")
-                    datastore_id = generate_new_datastore()
-                    get_url, post_dict = get_datastore_presigned_urls(bucket, prefix, datastore_id, duration)
-                    new_script.string = get_datastore_section(datastore_id, get_url, post_dict)
-                    head_tag.append(new_script)
-                    head_tag.append(soup.new_string("\n"))
-
-                html_content = str(soup)
-                with open(html_file, "w") as f:
-                    f.write(html_content)
-
-            elif file_extension == ".ipynb":
-                from nbconvert import HTMLExporter
-                from nbformat import NO_CONVERT, read
-
-                # Convert IPYNB to HTML
-                with open(html_file, "r", encoding="utf-8") as f:
-                    notebook_content = read(f, NO_CONVERT)
-
-                html_exporter = HTMLExporter(template_name="classic")
-                html_exporter.embed_images = True
-                (body, resources) = html_exporter.from_notebook_node(notebook_content)
-
-                # Write to a temp file
-                with tempfile.NamedTemporaryFile("w", delete=False) as temp_file:
-                    temp_file.write(body)
-                    temp_file.flush()
-                    temp_file_name = temp_file.name
-
-                html_file = temp_file_name
-
-            else:
-                raise ValueError(
-                    "You must use a .htm or .html extension for HTML pages, or .ipynb for Jupyter notebooks."
-                )
-
-            # Compute a short SHA1 hash for the final file
-            sha1_hash = compute_sha1_hash(html_file)
-            new_file_name = f"{file_basename}-{sha1_hash[:12]}{file_extension}"
-            s3_key = f"{prefix}/{new_file_name}" if prefix else new_file_name
-
-            # Upload to S3
-            s3_client.upload_file(
+            split_file_name(html_file)
+        except Exception as exc:
+            raise RuntimeError(f"Error while processing '{html_file}': {exc}") from exc
+
+        job_key = (html_file if _HTTP_RE.match(html_file) else os.path.realpath(html_file), bucket)
+        if job_key not in job_indices:
+            job_indices[job_key] = len(jobs)
+            jobs.append((html_file, bucket))
+        file_jobs.append(job_indices[job_key])
+
+    # With several files, one listing per bucket replaces a HEAD per datastore and per page (a single file
+    # keeps using HEADs). The listing is capped to a single page, None means unknown and also falls back to HEADs
+    existing_keys = {}
+    if len(jobs) > 1:
+        for file_bucket in {file_bucket for _, file_bucket in jobs}:
+            existing_keys[file_bucket] = list_existing_keys(file_bucket, prefix)
+
+    # Each file's S3 calls are latency bound, so overlap them across files (without idle threads for few files)
+    with ThreadPoolExecutor(max_workers=min(32, len(jobs))) as executor:
+        futures = [
+            executor.submit(
+                process_html_file,
                 html_file,
-                bucket,
-                s3_key,
-                ExtraArgs={"ContentType": "text/html", "CacheControl": "max-age=31536000, public"},
+                file_bucket,
+                prefix,
+                duration,
+                reset,
+                in_place,
+                strict_mime,
+                existing_keys.get(file_bucket),
             )
+            for html_file, file_bucket in jobs
+        ]
+
+        # Stop at the first failure, files that haven't started yet are left alone
+        results = []
+        for (html_file, _), future in zip(jobs, futures):
+            try:
+                results.append(future.result())
+            except NoCredentialsError:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise RuntimeError("AWS credentials not found. Please configure them.")
+            except Exception as exc:
+                executor.shutdown(wait=False, cancel_futures=True)
+                # Decide if you want to raise or just skip
+                raise RuntimeError(f"Error while processing '{html_file}': {exc}") from exc
+
+    return [results[job_index] for job_index in file_jobs]
+
+
+def process_html_file(html_file, bucket, prefix, duration, reset, in_place, strict_mime, existing_keys=None):
+    """
+    Prepares a single html or ipynb file (or HTTP link from tinyhost), uploads it to bucket,
+    and returns its signed URL. existing_keys is an optional snapshot of the keys under prefix.
+    """
+    is_link = bool(_HTTP_RE.match(html_file))
+    file_basename, file_extension = split_file_name(html_file)
+
+    if is_link:
+        # If the user passed an existing tinyhost link, download it straight into memory, it gets edited
+        # and re-uploaded from memory anyway. The bucket was already parsed from the domain by the caller
+        s3_key = urlparse(html_file).path.lstrip("/")
+        download_buffer = io.BytesIO()
+        s3_client.download_fileobj(bucket, s3_key, download_buffer, Config=_TRANSFER_CONFIG)
+        raw_content = download_buffer.getvalue()
+    else:
+        with open(html_file, "rb") as f:
+            raw_content = f.read()
+
+    # Process HTML or ipynb
+    if file_extension in [".htm", ".html"]:
+        # The extension already says html, libmagic (which only looks at the start of the file) is opt-in
+        if strict_mime and get_mime_detector().from_buffer(raw_content[:4096]) != "text/html":
+            raise ValueError("Your file was not detected as text/html.")
+
+        # Only the part up to </head> gets decoded and edited, the body stays as untouched bytes
+        # (pages without a </head> are decoded whole)
+        head_end = _HEAD_END_RE.search(raw_content)
+        split = head_end.end() if head_end else len(raw_content)
+
+        # Insert or update the datastore script
+        html_head = update_datastore_section(
+            raw_content[:split].decode("utf-8"), bucket, prefix, duration, reset, existing_keys
+        )
+        html_bytes = b"".join([html_head.encode("utf-8"), memoryview(raw_content)[split:]])
+
+        # Unchanged pages don't need rewriting
+        if in_place and not is_link and html_bytes != raw_content:
+            with open(html_file, "wb") as f:
+                f.write(html_bytes)
+
+    else:
+        from nbconvert import HTMLExporter
+        from nbformat import NO_CONVERT, reads
+
+        # Convert IPYNB to HTML
+        notebook_content = reads(raw_content.decode("utf-8"), NO_CONVERT)
+
+        html_exporter = HTMLExporter(template_name="classic")
+        html_exporter.embed_images = True
+        (body, resources) = html_exporter.from_notebook_node(notebook_content)
+
+        # The converted HTML is uploaded straight from memory
+        html_bytes = body.encode("utf-8")
+
+    return upload_html_file(html_bytes, bucket, prefix, file_basename, file_extension, duration, existing_keys)
+
+
+def split_file_name(html_file):
+    """
+    Checks that html_file (or HTTP link from tinyhost) can be hosted, and returns its lowercase base name
+    (without the hash suffix of tinyhost links) and extension.
+    """
+    if _HTTP_RE.match(html_file):
+        file_basename, file_extension = os.path.splitext(os.path.basename(urlparse(html_file).path))
+        # Strip out the final “-<12-char-hash>” if it exists
+        file_basename = _HASH_SUFFIX_RE.sub("", file_basename.lower())
+        file_extension = file_extension.lower()
+    else:
+        # Make sure local path exists
+        if not os.path.exists(html_file):
+            raise FileNotFoundError(f"Path {html_file} does not exist")
 
-            # Generate a signed URL
-            signed_url = s3_client.generate_presigned_url(
-                "get_object", Params={"Bucket": bucket, "Key": s3_key}, ExpiresIn=duration
-            )
+        file_basename, file_extension = os.path.splitext(os.path.basename(html_file))
+        file_basename, file_extension = file_basename.lower(), file_extension.lower()
 
-            results.append(signed_url)
+    if file_extension not in [".htm", ".html", ".ipynb"]:
+        raise ValueError("You must use a .htm or .html extension for HTML pages, or .ipynb for Jupyter notebooks.")
 
-        except NoCredentialsError:
-            raise RuntimeError("AWS credentials not found. Please configure them.")
-        except Exception as exc:
-            # Decide if you want to raise or just skip
-            raise RuntimeError(f"Error while processing '{html_file}': {exc}") from exc
-        finally:
-            if temp_file_name:
-                os.unlink(temp_file_name)
+    return file_basename, file_extension
+
+
+def upload_html_file(html_bytes, bucket, prefix, file_basename, file_extension, duration, existing_keys=None):
+    """
+    Uploads the final html_bytes to S3 under a content-hashed key, and returns a signed URL to it.
+    """
+    # Compute a short SHA1 hash for the final file, it only needs to make the URL unique (so not used for security)
+    sha1_hash = hashlib.sha1(html_bytes, usedforsecurity=False).hexdigest()
+    new_file_name = f"{file_basename}-{sha1_hash[:12]}{file_extension}"
+    s3_key = f"{prefix}/{new_file_name}" if prefix else new_file_name
+
+    # Upload to S3, unless the exact same content was already uploaded under this hashed key
+    if not s3_object_exists(bucket, s3_key, existing_keys):
+        s3_client.upload_fileobj(
+            io.BytesIO(html_bytes),
+            bucket,
+            s3_key,
+            ExtraArgs={"ContentType": "text/html", "CacheControl": "max-age=31536000, public"},
+            Config=_TRANSFER_CONFIG,
+        )
+
+    # Generate a signed URL
+    with stable_signing_time(duration):
+        return s3_client.generate_presigned_url(
+            "get_object", Params={"Bucket": bucket, "Key": s3_key}, ExpiresIn=duration
+        )
+
+
+@functools.lru_cache(maxsize=1)
+def get_mime_detector():
+    # Loading the libmagic database is slow, so share one instance (it is locked internally, so thread safe)
+    return magic.Magic(mime=True)
+
+
+def update_datastore_section(html_content, bucket, prefix, duration, reset, existing_keys=None):
+    """
+    Inserts (or refreshes) the tinyhost datastore <script> inside the <head> of html_content,
+    and returns the updated HTML.
+    """
+    head_match = _HEAD_RE.search(html_content)
+    if head_match:
+        head_start, head_close = head_match.start(), head_match.end() - len("</head>")
+    else:
+        head_match = _HEAD_START_RE.search(html_content)
+        if not head_match:
+            raise ValueError("Could not find <head> in your HTML. Please add one.")
+        body_match = _BODY_START_RE.search(html_content, head_match.end())
+        head_start, head_close = head_match.start(), body_match.start() if body_match else len(html_content)
+
+    # Pages that were already tinyhosted get their datastore <script> swapped out in place, everything else
+    # in the page is kept exactly as it was
+    datastore_match = _DATASTORE_RE.search(html_content, head_start, head_close)
+    if datastore_match:
+        if reset:
+            datastore_id = generate_new_datastore()
+        else:
+            # Attempt to find existing datastoreId
+            datastore_re = _DATASTORE_ID_RE.search(datastore_match.group(2))
+            datastore_id = datastore_re[1] if datastore_re else generate_new_datastore()
+
+        get_url, post_dict = get_datastore_presigned_urls(bucket, prefix, datastore_id, duration, existing_keys)
+        new_script = datastore_match.group(1) + get_datastore_section(datastore_id, get_url, post_dict) + "</script>"
+        return html_content[: datastore_match.start()] + new_script + html_content[datastore_match.end() :]
 
-    return results
+    # First time insertion, the new datastore <script> just goes at the end of the head, right before </head>
+    datastore_id = generate_new_datastore()
+    get_url, post_dict = get_datastore_presigned_urls(bucket, prefix, datastore_id, duration, existing_keys)
+    new_script = "<script>" + get_datastore_section(datastore_id, get_url, post_dict) + "</script>\n"
+    return html_content[:head_close] + new_script + html_content[head_close:]
 
 
 def generate_new_datastore():
-    return "".join(secrets.choice(string.ascii_letters + string.digits) for _ in range(20))
+    # 20 hex characters in a single CSPRNG call, hex keeps the id matching `const datastoreId = "(\w+)";`
+    return secrets.token_hex(10)
 
 
 def get_datastore_section(datastore_id, presigned_get_url, presigned_post_dict):
-    # Path to your datastore_template.js, adjust as needed
-    with open(os.path.join(os.path.dirname(__file__), "datastore_template.js"), "r") as f:
-        template = f.read()
+    values = {
+        "datastore_id": datastore_id,
+        "presigned_get_url": presigned_get_url,
+        "presigned_post_dict": dump_json(presigned_post_dict),
+    }
 
-    # Simple string replacements
-    template = template.replace("{{ datastore_id }}", datastore_id)
-    template = template.replace("{{ presigned_get_url }}", presigned_get_url)
-    template = template.replace("{{ presigned_post_dict }}", json.dumps(presigned_post_dict))
+    # A single join over the pre-split template, instead of search and replace passes
+    return "".join(values[part] if i % 2 else part for i, part in enumerate(_DATASTORE_TEMPLATE_PARTS))
 
-    # Optional indentation
-    template = "\n" + template
-    template = template.replace("\n", "\n    ").rstrip() + "\n"
 
-    return template
-
-
-def get_datastore_presigned_urls(bucket, prefix, datastore_id, duration):
+def get_datastore_presigned_urls(bucket, prefix, datastore_id, duration, existing_keys=None):
     MAX_DATASTORE_SIZE = 2 * 1024 * 1024  # 2 MB
     object_key = f"{prefix}/{datastore_id}.json" if prefix else f"{datastore_id}.json"
 
     # Check if datastore object exists; if not, create it
+    if not s3_object_exists(bucket, object_key, existing_keys):
+        empty_json = json.dumps({})
+        s3_client.put_object(Bucket=bucket, Key=object_key, Body=empty_json, ContentType="application/json")
+
+    with stable_signing_time(duration):
+        get_url = s3_client.generate_presigned_url(
+            "get_object", Params={"Bucket": bucket, "Key": object_key}, ExpiresIn=duration
+        )
+
+        # POST is used for the writing side, because it's the only way to ensure a maximum length
+        post_conditions = [
+            ["content-length-range", 0, MAX_DATASTORE_SIZE],
+        ]
+        post_dict = s3_client.generate_presigned_post(
+            Bucket=bucket, Key=object_key, Conditions=post_conditions, ExpiresIn=duration
+        )
+    return get_url, post_dict
+
+
+@contextlib.contextmanager
+def stable_signing_time(duration):
+    """
+    Within this block, presigned URLs from the current thread are signed with the time truncated to the hour.
+    Re-running tinyhost within the same hour then gives back identical URLs (and identical pages, whose
+    upload can be skipped), so browser caches stay valid. Links expire up to an hour before `duration`,
+    so this only kicks in for durations of at least a day.
+    """
+    _signing_clock.stable = duration >= 24 * 3600
     try:
-        s3_client.head_object(Bucket=bucket, Key=object_key)
+        yield
+    finally:
+        _signing_clock.stable = False
+
+
+def _patch_signing_clock():
+    def truncated_clock(real_get_current_datetime, flag):
+        def get_current_datetime(*args, **kwargs):
+            now = real_get_current_datetime(*args, **kwargs)
+            if getattr(_signing_clock, flag, False):
+                now = now.replace(minute=0, second=0, microsecond=0)
+            return now
+
+        return get_current_datetime
+
+    def presigning_add_auth(real_add_auth):
+        def add_auth(self, request):
+            presigning = getattr(_signing_clock, "presigning", False)
+            _signing_clock.presigning = presigning or getattr(_signing_clock, "stable", False)
+            try:
+                return real_add_auth(self, request)
+            finally:
+                _signing_clock.presigning = presigning
+
+        return add_auth
+
+    # SigV4 query auth and presigned POST policies read the time through get_current_datetime, older botocore
+    # versions read the clock directly and simply don't get stable URLs. Only the presign signers get the
+    # truncated time, regular requests signed with the same clock (ex. the STS call that refreshes assumed
+    # role credentials in the middle of a presign) must keep the real time, or AWS rejects them
+    if hasattr(botocore.auth, "get_current_datetime"):
+        botocore.auth.get_current_datetime = truncated_clock(botocore.auth.get_current_datetime, "presigning")
+        for name in ("SigV4QueryAuth", "S3SigV4PostAuth", "S3ExpressQueryAuth", "S3ExpressPostAuth"):
+            signer_class = getattr(botocore.auth, name, None)
+            if signer_class is not None:
+                signer_class.add_auth = presigning_add_auth(signer_class.add_auth)
+
+    # botocore.signers only reads the clock for the expiration of presigned POST policies
+    if hasattr(botocore.signers, "get_current_datetime"):
+        botocore.signers.get_current_datetime = truncated_clock(botocore.signers.get_current_datetime, "stable")
+
+    # SigV2 query auth (the default for presigned URLs in us-east-1) derives Expires from time.time(),
+    # through a private method that a botocore release could rename
+    if hasattr(botocore.auth.HmacV1QueryAuth, "_get_date"):
+        real_get_date = botocore.auth.HmacV1QueryAuth._get_date
+
+        def _get_date(self):
+            if getattr(_signing_clock, "stable", False):
+                return str(int(time.time()) // 3600 * 3600 + int(self._expires))
+            return real_get_date(self)
+
+        botocore.auth.HmacV1QueryAuth._get_date = _get_date
+
+
+# Thread local, so that regular requests signed concurrently on other threads keep using the real time
+_signing_clock = threading.local()
+_patch_signing_clock()
+
+
+def s3_object_exists(bucket, key, existing_keys=None):
+    if existing_keys is not None:
+        return key in existing_keys
+
+    try:
+        s3_client.head_object(Bucket=bucket, Key=key)
+        return True
     except ClientError as e:
         if e.response["Error"]["Code"] == "404":
-            empty_json = json.dumps({})
-            s3_client.put_object(Bucket=bucket, Key=object_key, Body=empty_json, ContentType="application/json")
-        else:
-            raise e
+            return False
+        raise e
 
-    get_url = s3_client.generate_presigned_url(
-        "get_object", Params={"Bucket": bucket, "Key": object_key}, ExpiresIn=duration
-    )
 
-    # POST is used for the writing side, because it's the only way to ensure a maximum length
-    post_conditions = [
-        ["content-length-range", 0, MAX_DATASTORE_SIZE],
-    ]
-    post_dict = s3_client.generate_presigned_post(
-        Bucket=bucket, Key=object_key, Conditions=post_conditions, ExpiresIn=duration
-    )
-    return get_url, post_dict
+def list_existing_keys(bucket, prefix, max_pages=1):
+    """
+    Returns the set of keys under prefix in bucket, or None if that would take more than max_pages
+    list calls (or listing isn't allowed), in which case checking keys one by one is cheaper.
+    """
+    keys: set[str] = set()
+    list_kwargs = {"Bucket": bucket, "Prefix": f"{prefix}/" if prefix else ""}
+    try:
+        for _ in range(max_pages):
+            page = s3_client.list_objects_v2(**list_kwargs)
+            keys.update(obj["Key"] for obj in page.get("Contents", []))
+            if not page.get("IsTruncated"):
+                return keys
+            list_kwargs["ContinuationToken"] = page["NextContinuationToken"]
+    except (ClientError, NoCredentialsError):
+        return None
+
+    # Too many keys (ex. a long used bucket without a prefix), the pages would be fetched one after the other
+    return None
 
 
 def compute_sha1_hash(file_path):
-    sha1 = hashlib.sha1()
+    # Not used by tinyhost itself anymore (pages are hashed in memory), only kept as public API
     with open(file_path, "rb") as f:
-        while chunk := f.read(8192):
-            sha1.update(chunk)
-    return sha1.hexdigest()
+        # Zero-length files can't be mmap'ed
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha1(usedforsecurity=False).hexdigest()
+
+        # Hash the whole mapped file in a single C call, without copying it through Python
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return hashlib.sha1(mm, usedforsecurity=False).hexdigest()
 
 
+@functools.lru_cache(maxsize=1)
 def run_new_bucket_flow():
-    sts_client = boto3.client("sts")
-    identity = sts_client.get_caller_identity()
-    arn = identity["Arn"]
-    username = arn.split("/")[-1]
-    bucket = f"{username}-tinyhost"
+    # An explicitly configured bucket, or the one found by a previous run, avoids the STS round trip
+    bucket = os.environ.get("TINYHOST_BUCKET")
+    if bucket:
+        return bucket
+
+    bucket = _read_cached_bucket()
+    if bucket:
+        try:
+            s3_client.head_bucket(Bucket=bucket)
+            return bucket
+        except ClientError:
+            # Deleted, or the credentials changed, so find the bucket from scratch
+            pass
+
+    bucket = f"{get_caller_username()}-tinyhost"
 
     try:
         s3_client.head_bucket(Bucket=bucket)
-        return bucket
     except ClientError as e:
         error_code = e.response["Error"]["Code"]
         if error_code == "404":
             s3_client.create_bucket(Bucket=bucket)
-            return bucket
         else:
             raise RuntimeError(f"Error checking bucket existence: {e}")
 
+    _write_cached_bucket(bucket)
+    return bucket
+
+
+@functools.lru_cache(maxsize=1)
+def get_caller_username():
+    identity = get_sts_client().get_caller_identity()
+    arn = identity["Arn"]
+    return arn.split("/")[-1]
+
+
+@functools.lru_cache(maxsize=1)
+def get_sts_client():
+    return _session.client("sts")
+
+
+def _read_cached_bucket():
+    try:
+        with open(_BUCKET_CACHE_PATH, "r") as f:
+            return json.load(f).get(_session.profile_name)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _write_cached_bucket(bucket):
+    # The cache is keyed by AWS profile, since each set of credentials gets its own bucket
+    try:
+        with open(_BUCKET_CACHE_PATH, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    if not isinstance(cache, dict):
+        cache = {}
+    cache[_session.profile_name] = bucket
+
+    try:
+        with open(_BUCKET_CACHE_PATH, "w") as f:
+            json.dump(cache, f)
+    except OSError:
+        # Caching is only an optimization
+        pass
+
 
 @click.command()
 @click.option("--bucket", help="S3 bucket on which to host your static site")
@@ -275,8 +571,21 @@ def run_new_bucket_flow():
     default=604800,
     help="Length of time in seconds that the resulting link will work for. Default is 1 week.",
 )
+@click.option(
+    "--in-place/--no-in-place",
+    show_default=True,
+    default=True,
+    help="Save the datastore section into your local html files, so that the next run reuses the same datastore",
+)
+@click.option(
+    "--strict-mime",
+    is_flag=True,
+    show_default=True,
+    default=False,
+    help="Also check that html files are detected as text/html by libmagic",
+)
 @click.argument("html_files", nargs=-1, type=str)
-def tinyhost(html_files, bucket, prefix, duration, reset):
+def tinyhost(html_files, bucket, prefix, duration, reset, in_place, strict_mime):
     """
     Hosts your html_files (or .ipynb's) on an S3 bucket, and gives back signed URLs.
     """
@@ -287,7 +596,15 @@ def tinyhost(html_files, bucket, prefix, duration, reset):
         return
 
     try:
-        urls = tinyhost_main(html_files=html_files, bucket=bucket, prefix=prefix, duration=duration, reset=reset)
+        urls = tinyhost_main(
+            html_files=html_files,
+            bucket=bucket,
+            prefix=prefix,
+            duration=duration,
+            reset=reset,
+            in_place=in_place,
+            strict_mime=strict_mime,
+        )
         for url in urls:
             click.echo(f"\nAccess it at:\n{url}\n")
     except Exception as e: